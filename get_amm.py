@@ -1,12 +1,132 @@
+import html
+import json
 import re
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from zipfile import ZipFile
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import requests
-from bs4 import BeautifulSoup
+from pyarrow import compute as pc
+from pyarrow import csv as pa_csv
+
+# Terms of 'mentions autorisees' for the organic products, and of 'identifiant usage'
+# for the vines
+BIO_MENTIONS = ["agriculture biologique", "production biologique"]
+VIGNE_USAGE = "vigne"
+
+# Usages excluded from the output because they are marginal for organic vines
+EXCLUDE_USAGES = [
+    "Thrips",
+    "Black rot",
+    "Bactérioses",
+    "Excoriose",
+    "Erinose",
+    "Cochenilles",
+    "Aleurodes",
+    "Pourriture grise",
+    "Mouches",
+    "Stad. Hivern. Ravageurs",
+    "lack dead arm",
+    "Esca",
+    "Chenilles phytophages",
+    "Eutypiose",
+    "Acariens",
+]
+
+# Active substances of the insecticides, the others table excludes them with the
+# sulphur, copper and pheromone products already listed in their own tables
+INSECTICIDE_SUBSTANCES = ["Spinosad", "Bacillus", "pyréthrines"]
+OTHERS_EXCLUDED_SUBSTANCES = INSECTICIDE_SUBSTANCES + [
+    "soufre",
+    "Sulphur",
+    "cuivre",
+    "pheromones",
+]
+
+# The patterns of .str.contains and .str.replace are kept as strings: on Arrow string
+# columns they run on Arrow kernels, which do not accept compiled regular expressions.
+# .str.extract runs with Python's re, so its patterns below are compiled
+_INSECTICIDE_PATTERN = "|".join(map(re.escape, INSECTICIDE_SUBSTANCES))
+_OTHERS_EXCLUDED_PATTERN = "|".join(map(re.escape, OTHERS_EXCLUDED_SUBSTANCES))
+# Lowercased, to search the lowercased mentions. On Arrow strings the alternation runs
+# in a single RE2 pass, RE2 never backtracks
+_EXCLUDE_USAGES_PATTERN = "|".join(
+    re.escape(exclude_usage.lower()) for exclude_usage in EXCLUDE_USAGES
+)
+
+# Arrow types of the columns read from the CSV, the other columns are not read. All the
+# types are given: a column empty in the first block cannot be inferred as null and
+# break the next blocks.
+# Free text columns become Arrow strings in pandas, so the .str methods run on Arrow
+# kernels instead of Python objects. Columns with few distinct values are dictionaries,
+# they become categories and the string operations only run on those values.
+_CATEGORY = pa.dictionary(pa.int32(), pa.string())
+INPUT_COLUMN_TYPES = {
+    "nom produit": pa.string(),
+    "seconds noms commerciaux": pa.string(),
+    "Substances actives": pa.string(),
+    "fonctions": _CATEGORY,
+    "mentions autorisees": pa.string(),
+    "identifiant usage": pa.string(),
+    "etat usage": _CATEGORY,
+    "condition emploi": _CATEGORY,
+    "gamme usage": _CATEGORY,
+    "dose retenue": pa.float64(),
+    "nombre max d'application": pa.float64(),
+}
+
+# The CSV is parsed by blocks of this size, only the rows for organic vines are kept
+_CSV_BLOCK_SIZE = 8 * 1024 * 1024
+
+# Narrowest dtypes of the output columns, applied when a product table contains them.
+# Concentration and Dose stay in float64: float32 only keeps about 7 significant
+# digits, and some doses of the others table are above 1e6
+OUTPUT_DTYPES = {
+    "Biocontrôle (1/0)": "uint8",
+    "Insecticide": "uint8",
+    "nombre max d'application": "Int16",
+}
+
+# Names of the columns in the Excel sheet, unknown columns are left as they are
+OUTPUT_COLUMN_NAMES = {
+    "nom produit": "Spécialité commerciale",
+    "Active Compound": "Matière active (M.A.)",
+    "Autres": "Autre",
+    "Concentration": "Concentration en M.A. (% )",
+    "dose retenue": "Dose d'homologation (en kg ou L / ha)",
+    "Dose": "Dose d'homologation (en kg ou L / ha)",
+    "nombre max d'application": "Nombre de traitements autorisés",
+    "Biocontrôle (1/0)": "New Biocontrol Column",  # Example with a column not present in the DataFrame
+}
+
+# One session for all the requests: the connection to data.gouv.fr is kept alive
+_SESSION = requests.Session()
+
+# Downloaded files are kept here and only downloaded again when they changed
+CACHE_DIR = Path("~/.cache/get_amm").expanduser()
+_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# The output CSV is written through a buffer of this size, in a few large writes
+_WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Active compound of 'Substances actives': everything before the first parenthesis,
+# without the trailing spaces
+_ACTIVE_COMPOUND_RE = re.compile(r"^([^(]*?)\s*(?:\(|$)")
+
+# Concentration part of 'Substances actives': between the first closing parenthesis
+# and the next one, like .str.split(")").str[1] but without building the lists
+_CONCENTRATION_RE = re.compile(r"\)([^)]*)")
+
+# Everything but the digits of a concentration, "400.0 g/kg" keeps "4000"
+_NON_DIGITS_PATTERN = r"[^0-9]+"
+
+# First link to the utf8 zip in the raw page, no need to build the whole HTML tree.
+# The attribute may be quoted with double or single quotes
+_UTF8_ZIP_HREF_RE = re.compile(rb"""href=(["'])([^"']*-utf8\.zip[^"']*)\1""")
 
 
 class URLNotFoundError(Exception):
@@ -17,10 +137,13 @@ class FileNameNotFoundError(Exception):
     pass
 
 
+@lru_cache(maxsize=1)
 def get_url():
     """
     Retrieves the URL used to download the file with the amm information. It' the one
     ending with '-utf8.zip' from the specified root URL (government Open Data)
+    The page is cached like the zip file, see 'download_to_cache', and the URL is only
+    looked up once per Python process.
 
     Returns:
     str or int: If a matching URL is found, returns the URL as a string.
@@ -28,19 +151,79 @@ def get_url():
     """
 
     root_url = "https://www.data.gouv.fr/fr/datasets/donnees-ouvertes-du-catalogue-e-phy-des-produits-phytopharmaceutiques-matieres-fertilisantes-et-supports-de-culture-adjuvants-produits-mixtes-et-melanges/"
-    root_html = requests.get(root_url)
+    # The page rarely changes, it is only downloaded again when its ETag or
+    # Last-Modified header changed
+    root_html = download_to_cache(root_url, "dataset_page.html").read_bytes()
 
-    soup_amm = BeautifulSoup(root_html.text, features="lxml")
+    match = _UTF8_ZIP_HREF_RE.search(root_html)
+    if match:
+        return html.unescape(match.group(2).decode("utf-8"))
 
-    anchor_tags = soup_amm.find_all("a")
+    raise URLNotFoundError("URL ending with '-utf8.zip' not found on the page.")
 
-    for tag in anchor_tags:
-        href = tag.get("href")
-        if href:
-            if "-utf8.zip" in href:
-                return href
 
-    raise URLNotFoundError("URL ending with '-utf8.zip' not found on the page.")
+def download_to_cache(url, cache_name):
+    """
+    Downloads the file at the URL into CACHE_DIR, unless the cached copy is still up to date.
+
+    Args:
+        url (str): The URL of the file to download.
+        cache_name (str): The name of the file in CACHE_DIR. It does not depend on the
+            URL, so a new release of the dataset replaces the previous one.
+
+    Returns:
+        Path: The path of the cached file.
+
+    Operation:
+    * The URL, the 'ETag' and the 'Last-Modified' headers are saved next to the cached
+      file in a JSON file.
+    * When a cached copy of the same URL exists, the request sends them back as
+      'If-None-Match' and 'If-Modified-Since'. An HTTP 304 answer means nothing changed,
+      nothing is downloaded.
+    * Otherwise the file is streamed to a temporary file, then moved in place, so an
+      interrupted download never replaces a good cached copy. The temporary file is
+      deleted when the download fails.
+    """
+    cached_file = CACHE_DIR / cache_name
+    validators_file = cached_file.with_suffix(".json")
+
+    headers = {}
+    if cached_file.exists() and validators_file.exists():
+        validators = json.loads(validators_file.read_text(encoding="utf-8"))
+    else:
+        validators = {}
+    # The validators of a previous release do not apply to a new URL
+    if validators.get("url") == url:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    with _SESSION.get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            return cached_file
+        response.raise_for_status()
+
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        partial_file = cached_file.with_suffix(".part")
+        try:
+            with open(partial_file, "wb") as f:
+                for chunk in response.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+        except BaseException:
+            # No half-downloaded file is left in the cache
+            partial_file.unlink(missing_ok=True)
+            raise
+        partial_file.replace(cached_file)
+
+        validators = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        validators_file.write_text(json.dumps(validators), encoding="utf-8")
+
+    return cached_file
 
 
 def download_and_extract_dataframe(
@@ -48,28 +231,75 @@ def download_and_extract_dataframe(
 ):
     """
     Downloads a zip file from the URL with AMM data and extracts its CSV contents into a Pandas DataFrame.
+    The zip file is cached, see 'download_to_cache'.
 
     Args:
         amm_url (str): The URL of the zip file to download and extract.
         file_name (str): The name of the CSV file to extract from the zip archive.
 
     Returns:
-        pd.DataFrame: A pandas DataFrame containing the CSV content.
-    """
-    response = requests.get(amm_url)
+        pd.DataFrame: A pandas DataFrame containing the rows of the CSV for organic
+            products used on vines, with the columns of INPUT_COLUMN_TYPES.
 
-    with ZipFile(BytesIO(response.content), "r") as zip_file:
-        file_list = zip_file.namelist()
+    Operation:
+    * The CSV is streamed from the archive by blocks of _CSV_BLOCK_SIZE bytes.
+    * Each block is filtered with '_is_bio_vigne' before the next one is read, so the
+      whole file (mostly other crops) is never held in memory.
+    """
+    zip_path = download_to_cache(amm_url, Path(file_name).with_suffix(".zip").name)
 
-        if file_name not in file_list:
+    with ZipFile(zip_path, "r") as zip_file:
+        # getinfo is a dict lookup, the archive entries are not scanned
+        try:
+            csv_info = zip_file.getinfo(file_name)
+        except KeyError:
             raise FileNameNotFoundError(
                 f"File '{file_name}' not found in the zip archive."
             )
 
-        with zip_file.open(file_name) as csv_file:
-            # FRENCH format --> separator is ";", set encoding too
-            df = pd.read_csv(csv_file, sep=";", encoding="utf-8")
-            return df
+        with zip_file.open(csv_info) as csv_file:
+            # FRENCH format --> separator is ";", the encoding is utf-8
+            reader = pa_csv.open_csv(
+                csv_file,
+                read_options=pa_csv.ReadOptions(block_size=_CSV_BLOCK_SIZE),
+                # Quoted fields may span several lines, even across two blocks
+                parse_options=pa_csv.ParseOptions(
+                    delimiter=";", newlines_in_values=True
+                ),
+                # Empty fields are missing values, as with pd.read_csv
+                convert_options=pa_csv.ConvertOptions(
+                    column_types=INPUT_COLUMN_TYPES,
+                    include_columns=list(INPUT_COLUMN_TYPES),
+                    strings_can_be_null=True,
+                ),
+            )
+            bio_vigne_batches = [batch.filter(_is_bio_vigne(batch)) for batch in reader]
+
+    table = pa.Table.from_batches(bio_vigne_batches, schema=reader.schema)
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+
+
+def _is_bio_vigne(batch):
+    """
+    Selects the rows of a CSV block for organic products used on vines, the first two
+    criteria of 'clean_df_amm', so the other rows are dropped as soon as they are read.
+
+    Args:
+        batch (pa.RecordBatch): A block of the CSV file.
+
+    Returns:
+        pa.BooleanArray: The mask of the rows to keep, null when the text is missing.
+    """
+    mentions = batch.column("mentions autorisees")
+    is_bio = pc.match_substring(mentions, BIO_MENTIONS[0], ignore_case=True)
+    for bio_mention in BIO_MENTIONS[1:]:
+        is_bio = pc.or_kleene(
+            is_bio, pc.match_substring(mentions, bio_mention, ignore_case=True)
+        )
+    is_vigne = pc.match_substring(
+        batch.column("identifiant usage"), VIGNE_USAGE, ignore_case=True
+    )
+    return pc.and_kleene(is_bio, is_vigne)
 
 
 def clean_df_amm(df_amm):
@@ -85,53 +315,33 @@ def clean_df_amm(df_amm):
     Returns:
         pd.DataFrame: A cleaned DataFrame containing rows that meet the specified criteria.
 
-    Technical riteria:
+    Technical criteria (all combined into a single mask):
     1. Select rows where the column "mentions autorisees" contains the term
-       "Utilisable en agriculture biologique" (case-insensitive).
-    2. Further filter the DataFrame to rows where the column "identifiant usage"
-       contains the term "vigne" (case-insensitive).
+       "agriculture biologique" or "production biologique" (case-insensitive).
+    2. Select rows where the column "identifiant usage" contains the term
+       "vigne" (case-insensitive).
     3. Exclude rows where the column "mentions autorisees" contains any of the terms
-       in the list of "exclude_usages" (case-insensitive).
-    4. Select rows where the column "etat usage" contains the term "Retrait" (case-insensitive).
+       in the list of EXCLUDE_USAGES (case-insensitive).
+    4. Select rows where the column "etat usage" starts with the term "Autorisé".
     """
-    df_bio = df_amm[
-        df_amm["mentions autorisees"].str.contains(
-            "agriculture biologique|production biologique", case=False, na=False
-        )
-    ]
+    # The text columns are lowercased once, then the tests are plain substring
+    # searches (regex=False), except the excluded usages searched all at once
+    mentions = df_amm["mentions autorisees"].str.lower()
+    usages = df_amm["identifiant usage"].str.lower()
 
-    df_bio_vigne = df_bio[
-        df_bio["identifiant usage"].str.contains("vigne", case=False, na=False)
-    ]
-    exclude_usages = [
-        "Thrips",
-        "Black rot",
-        "Bactérioses",
-        "Excoriose",
-        "Erinose",
-        "Cochenilles",
-        "Aleurodes",
-        "Pourriture grise",
-        "Mouches",
-        "Stad. Hivern. Ravageurs",
-        "lack dead arm",
-        "Esca",
-        "Chenilles phytophages",
-        "Eutypiose",
-        "Acariens",
-    ]
+    is_bio = pd.Series(False, index=df_amm.index)
+    for bio_mention in BIO_MENTIONS:
+        is_bio |= mentions.str.contains(bio_mention, regex=False, na=False)
+    is_vigne = usages.str.contains(VIGNE_USAGE, regex=False, na=False)
 
-    df_bio_vigne_main = df_bio_vigne[
-        ~df_bio_vigne["mentions autorisees"].str.contains(
-            "|".join(exclude_usages), case=False, na=False
-        )
-    ]
+    is_excluded = mentions.str.contains(_EXCLUDE_USAGES_PATTERN, na=False)
 
-    df_bio_vigne_main_authorised = df_bio_vigne_main[
-        df_bio_vigne_main["etat usage"].str.contains("Autorisé", na=False)
-    ]
+    is_authorised = df_amm["etat usage"].str.startswith("Autorisé", na=False)
 
-    df_bio_vigne_main_authorised = df_bio_vigne_main_authorised.reset_index()
+    # Masks are combined first so the rows are copied a single time
+    df_bio_vigne_main_authorised = df_amm.loc[
+        is_bio & is_vigne & ~is_excluded & is_authorised
+    ].reset_index()
 
     return df_bio_vigne_main_authorised
 
@@ -152,23 +362,17 @@ def add_others(df_bio_vigne_main_authorised):
     - If both conditions are met, 'Autres' will contain 'badigeon|Jardin autorisé', separated by a pipe (|) character.
     """
 
-    # Function to merge two columns with a pipe separator
-    def merge_columns(row):
-        result = ""
-
-        # Check for 'badigeon' in 'condition emploi'
-        if pd.notna(row["condition emploi"]) and "badigeon" in row["condition emploi"]:
-            result += "badigeon"
-
-        # Check for 'jardin' in 'gamme usage'
-        if pd.notna(row["gamme usage"]) and "jardin" in row["gamme usage"]:
-            result += "|" if result else ""
-            result += "Jardin autorisé"
-
-        return result
+    has_badigeon = df_bio_vigne_main_authorised["condition emploi"].str.contains(
+        "badigeon", regex=False, na=False
+    )
+    has_jardin = df_bio_vigne_main_authorised["gamme usage"].str.contains(
+        "jardin", regex=False, na=False
+    )
 
-    df_bio_vigne_main_authorised["Autres"] = df_bio_vigne_main_authorised.apply(
-        merge_columns, axis=1
+    df_bio_vigne_main_authorised["Autres"] = np.select(
+        [has_badigeon & has_jardin, has_badigeon, has_jardin],
+        ["badigeon|Jardin autorisé", "badigeon", "Jardin autorisé"],
+        default="",
     )
 
     return df_bio_vigne_main_authorised
@@ -188,63 +392,153 @@ def get_active_compound(df_bio_vigne_main_authorised_with_others):
     Operation:
       The function extracts the active compound from the 'Substances actives' column, which typically includes
       information about the active compound and its concentration. It creates a new column 'Active Compound'
-      containing only the active compound name.
+      containing only the active compound name, without trailing spaces.
     """
     df_bio_vigne_main_authorised_with_others["Active Compound"] = (
-        df_bio_vigne_main_authorised_with_others["Substances actives"]
-        .str.split("(")
-        .str[0]
+        df_bio_vigne_main_authorised_with_others["Substances actives"].str.extract(
+            _ACTIVE_COMPOUND_RE, expand=False
+        )
     )
     return df_bio_vigne_main_authorised_with_others
 
 
-def process_concentration(value):
+def process_concentration(values):
+    """
+    Extracts and processes the concentration values from the 'Substances actives' column.
+
+    Args:
+        values (pd.Series): The values from the 'Substances actives' column.
+
+    Returns:
+        pd.Series: The processed concentration values as floats, rounded to two decimal places,
+            or np.nan when no number can be extracted.
+
+    Operation:
+    * The function keeps only the digits of each value, the whole column at once.
+    * It checks if the value contains a percent sign ("%"). Percentages are divided by 10,
+      other values (" g/" and the rest) by 100, then rounded.
+    * Values without any digit, or missing values, give np.nan.
     """
-    Extracts and processes the concentration value from the 'Substances actives' column.
+    concentration_number = pd.to_numeric(
+        values.str.replace(_NON_DIGITS_PATTERN, "", regex=True), errors="coerce"
+    )
+    divisor = np.where(values.str.contains("%", regex=False, na=False), 10, 100)
+
+    return (concentration_number / divisor).round(2)
+
+
+def get_concentration_and_dose(df_bio_vigne_main_authorised_with_others_compounds):
+    """
+    Computes the 'Concentration' and 'Dose' columns once for all the products, so the
+    create_df_* functions only have to select their rows.
 
     Args:
-        value (str): The value from the 'Substances actives' column.
+        df_bio_vigne_main_authorised_with_others_compounds (pd.DataFrame): The DataFrame containing information about pesticides.
 
     Returns:
-        float or np.nan: The processed concentration value as a float, rounded to two decimal places,
-            or np.nan if an error occurs during processing.
+        pd.DataFrame: The DataFrame with the new 'Concentration' and 'Dose' columns added.
 
     Operation:
-    * The function extracts numeric characters from the input value using a regular expression.
-    * It checks if the value contains a percent sign ("%") or " g/". Depending on the case,
-      it removes non-numeric characters, converts the value to a float, and rounds it accordingly.
-    * If any error occurs during processing, it returns np.nan.
+    * 'Concentration' is the part of 'Substances actives' after the first closing parenthesis,
+      processed with the 'process_concentration' function.
+    * 'Dose' is the concentration applied to the 'dose retenue'. It is not rounded, each
+      product table rounds it to its own precision.
+    """
+    df_bio_vigne_main_authorised_with_others_compounds["Concentration"] = (
+        process_concentration(
+            df_bio_vigne_main_authorised_with_others_compounds[
+                "Substances actives"
+            ].str.extract(_CONCENTRATION_RE, expand=False)
+        )
+    )
+    # One NumPy expression, without intermediate Series. It stays in float64: in
+    # float32 a dose like 0.15 becomes 0.1499... and is rounded down to 0.1
+    concentration = df_bio_vigne_main_authorised_with_others_compounds[
+        "Concentration"
+    ].to_numpy(np.float64, na_value=np.nan)
+    dose_retenue = df_bio_vigne_main_authorised_with_others_compounds[
+        "dose retenue"
+    ].to_numpy(np.float64, na_value=np.nan)
+    df_bio_vigne_main_authorised_with_others_compounds["Dose"] = (
+        concentration / 100 * dose_retenue
+    )
+
+    return df_bio_vigne_main_authorised_with_others_compounds
+
+
+def _contains_flag(values, term):
+    """
+    Flags the values containing the given term (case-insensitive) as 1, the others as 0.
+
+    Args:
+        values (pd.Series): The string column to search.
+        term (str): The term to look for.
+
+    Returns:
+        pd.Series: A uint8 column of 1/0 flags.
+    """
+    return values.str.contains(term, case=False, regex=False, na=False).astype(np.uint8)
+
+
+def _downcast(df):
+    """
+    Casts the columns of a product table to the narrow dtypes of OUTPUT_DTYPES.
+
+    Args:
+        df (pd.DataFrame): A product table.
+
+    Returns:
+        pd.DataFrame: The same table with smaller numeric columns.
+
+    A column is only cast to an integer dtype when all its values are whole numbers,
+    otherwise it is left as it is, so an unexpected value like 2.5 is written unchanged.
     """
+    dtypes = {}
+    for column, dtype in OUTPUT_DTYPES.items():
+        if column not in df.columns:
+            continue
+        if (
+            pd.api.types.is_integer_dtype(dtype)
+            and not (df[column].dropna() % 1 == 0).all()
+        ):
+            continue
+        dtypes[column] = dtype
 
-    def remove_non_numbers(input_string):
-        # Use a regular expression to match only digits and points
-        cleaned_string = re.sub(r"[^0-9.]", "", input_string)
-        return cleaned_string
+    return df.astype(dtypes)
 
-    try:
-        concentration_number = "".join([char for char in value if char.isdigit()])
 
-        if "%" in value:
-            clean_concentration_number = remove_non_numbers(concentration_number)
-            concentration = round(float(clean_concentration_number) / 10, 2)
-        elif " g/" in value:
-            clean_concentration_number = remove_non_numbers(concentration_number)
-            concentration = round(float(clean_concentration_number) / 100, 2)
-        else:
-            clean_concentration_number = remove_non_numbers(concentration_number)
-            concentration = round(float(clean_concentration_number) / 100, 2)
+def get_flags(df_bio_vigne_main_authorised_with_others_compounds):
+    """
+    Computes the 1/0 flag columns once for all the products, so the create_df_* functions
+    only have to select their rows instead of scanning the text columns again.
 
-        return concentration
+    Args:
+        df_bio_vigne_main_authorised_with_others_compounds (pd.DataFrame): The DataFrame containing information about pesticides.
+
+    Returns:
+        pd.DataFrame: The DataFrame with the new 'Biocontrôle (1/0)' and 'Insecticide' columns added.
+
+    Operation:
+    * 'Biocontrôle (1/0)': 1 if 'mentions autorisees' contains the term 'biocontrôle', 0 otherwise.
+    * 'Insecticide': 1 if 'fonctions' contains the term 'insecticide', 0 otherwise.
+    """
+    df_bio_vigne_main_authorised_with_others_compounds["Biocontrôle (1/0)"] = (
+        _contains_flag(
+            df_bio_vigne_main_authorised_with_others_compounds["mentions autorisees"],
+            "biocontrôle",
+        )
+    )
+    df_bio_vigne_main_authorised_with_others_compounds["Insecticide"] = _contains_flag(
+        df_bio_vigne_main_authorised_with_others_compounds["fonctions"], "insecticide"
+    )
 
-    except:
-        return np.nan
+    return df_bio_vigne_main_authorised_with_others_compounds
 
 
 def make_second_names_main(df_bio_vigne_main_authorised_with_others_compounds):
     """
     Expand the DataFrame by creating new rows for each product name in the 'seconds noms commerciaux' column.
     Each new line has the second name as the main name ("nom produit").
-    WARNING: this uses iterrows(). It should be fine since the volume of data is low.
 
     Args:
         df_bio_vigne_main_authorised_with_others_compounds (DataFrame): The input DataFrame.
@@ -252,21 +546,18 @@ def make_second_names_main(df_bio_vigne_main_authorised_with_others_compounds):
     Returns:
         DataFrame: A new DataFrame with additional rows for each product name in the 'seconds noms commerciaux' column.
     """
-    column_names = df_bio_vigne_main_authorised_with_others_compounds.columns.tolist()
-    df_second_name = pd.DataFrame(columns=column_names)
-    for _, row in df_bio_vigne_main_authorised_with_others_compounds.iterrows():
-        second_names_raw = row["seconds noms commerciaux"]
-        if pd.notna(second_names_raw):
-            second_names_list = second_names_raw.split("|")
-            for second_name in second_names_list:
-                second_name = second_name.strip()
-
-                second_row = row.copy()
-                second_row["nom produit"] = second_name
+    df_second_name = df_bio_vigne_main_authorised_with_others_compounds[
+        df_bio_vigne_main_authorised_with_others_compounds[
+            "seconds noms commerciaux"
+        ].notna()
+    ].copy()
 
-                df_second_name = pd.concat(
-                    [df_second_name, second_row.to_frame().T], ignore_index=True
-                )
+    # One row per second name, split in a single pass instead of iterrows()
+    df_second_name["nom produit"] = df_second_name[
+        "seconds noms commerciaux"
+    ].str.split("|")
+    df_second_name = df_second_name.explode("nom produit")
+    df_second_name["nom produit"] = df_second_name["nom produit"].str.strip()
 
     df_bio_vigne_main_authorised_with_others_compounds = pd.concat(
         [df_bio_vigne_main_authorised_with_others_compounds, df_second_name],
@@ -295,14 +586,7 @@ def create_df_cuivre(df_bio_vigne_main_authorised_with_others_compounds):
         ].str.contains("cuivre", case=False, na=False)
     ].reset_index(drop=True)
 
-    df_cuivre["Concentration"] = df_cuivre["Substances actives"].str.split(")").str[1]
-
-    df_cuivre["Concentration"] = df_cuivre["Concentration"].apply(process_concentration)
-    df_cuivre["Dose"] = (
-        ((df_cuivre["Concentration"] / 100) * df_cuivre["dose retenue"])
-        .astype(float)
-        .round(1)
-    )
+    df_cuivre["Dose"] = df_cuivre["Dose"].round(1)
     df_cuivre = df_cuivre[
         [
             "nom produit",
@@ -315,7 +599,7 @@ def create_df_cuivre(df_bio_vigne_main_authorised_with_others_compounds):
         ]
     ]
 
-    return df_cuivre
+    return _downcast(df_cuivre)
 
 
 def create_df_soufre(df_bio_vigne_main_authorised_with_others_compounds):
@@ -337,18 +621,7 @@ def create_df_soufre(df_bio_vigne_main_authorised_with_others_compounds):
         ].str.contains("soufre|sulphur", case=False, na=False)
     ].reset_index(drop=True)
 
-    df_soufre["Concentration"] = df_soufre["Substances actives"].str.split(")").str[1]
-
-    df_soufre["Concentration"] = df_soufre["Concentration"].apply(process_concentration)
-    df_soufre["Dose"] = (
-        ((df_soufre["Concentration"] / 100) * df_soufre["dose retenue"])
-        .astype(float)
-        .round(1)
-    )
-
-    df_soufre["Biocontrôle (1/0)"] = df_soufre["mentions autorisees"].apply(
-        lambda x: 1 if "biocontrôle" in x.lower() else 0
-    )
+    df_soufre["Dose"] = df_soufre["Dose"].round(1)
     df_soufre = df_soufre[
         [
             "nom produit",
@@ -361,7 +634,7 @@ def create_df_soufre(df_bio_vigne_main_authorised_with_others_compounds):
         ]
     ]
 
-    return df_soufre
+    return _downcast(df_soufre)
 
 
 def create_df_insecticide(df_bio_vigne_main_authorised_with_others_compounds):
@@ -376,12 +649,10 @@ def create_df_insecticide(df_bio_vigne_main_authorised_with_others_compounds):
 
     The function filters the input DataFrame based on the 'fonctions' column, selecting rows where the term
     'insecticide' is present. It then further filters based on specified active substances: 'Spinosad', 'Bacillus',
-    and 'pyréthrines'. The 'Concentration' column is derived from the 'Substances actives' column, and concentration
-    values are processed using the 'process_concentration' function. For products containing 'Bacillus', the concentration
-    is set to 0 by convention.
+    and 'pyréthrines'. The 'Dose' column comes from 'get_concentration_and_dose'. For products containing
+    'Bacillus', the convention is a zero 'Dose'.
 
-    The 'Dose' column is calculated based on the concentration and 'dose retenue'. Additionally, a 'Biocontrôle (1/0)'
-    column is created, with 1 indicating the presence of 'biocontrôle' in the 'mentions autorisees', and 0 otherwise.
+    The 'Dose' column is rounded to three decimal places. The 'Biocontrôle (1/0)' column comes from 'get_flags'.
 
     The resulting DataFrame includes columns: 'nom produit', 'Active Compound', 'Autres', 'dose retenue', 'Dose',
     'Biocontrôle (1/0)', and 'nombre max d'application'.
@@ -392,38 +663,22 @@ def create_df_insecticide(df_bio_vigne_main_authorised_with_others_compounds):
         )
     ].reset_index(drop=True)
 
-    substances_to_include = ["Spinosad", "Bacillus", "pyréthrines"]
-
     df_insecticide = df_insecticide[
-        df_insecticide["Substances actives"].apply(
-            lambda x: any(sub in x for sub in substances_to_include)
+        df_insecticide["Substances actives"].str.contains(
+            _INSECTICIDE_PATTERN, na=False
         )
     ].reset_index(drop=True)
 
-    df_insecticide["Concentration"] = (
-        df_insecticide["Substances actives"].str.split(")").str[1]
-    )
-    df_insecticide["Concentration"] = df_insecticide["Concentration"].apply(
-        process_concentration
+    # By convention, the dose of the Bacillus products is 0 (it stays empty when there
+    # is no 'dose retenue')
+    is_bacillus = df_insecticide["Substances actives"].str.contains(
+        "Bacillus", case=False, na=False
     )
-
-    # By convention, when the product is Bacillus the concentration is set to 0
-    df_insecticide.loc[
-        df_insecticide["Substances actives"].str.contains(
-            "Bacillus", case=False, na=False
-        ),
-        "Concentration",
-    ] = 0
-
-    df_insecticide["Dose"] = (
-        ((df_insecticide["Concentration"] / 100) * df_insecticide["dose retenue"])
-        .astype(float)
-        .round(3)
+    df_insecticide["Dose"] = df_insecticide["Dose"].mask(
+        is_bacillus, df_insecticide["dose retenue"] * 0
     )
 
-    df_insecticide["Biocontrôle (1/0)"] = df_insecticide["mentions autorisees"].apply(
-        lambda x: 1 if "biocontrôle" in x.lower() else 0
-    )
+    df_insecticide["Dose"] = df_insecticide["Dose"].round(3)
 
     df_insecticide = df_insecticide[
         [
@@ -437,7 +692,7 @@ def create_df_insecticide(df_bio_vigne_main_authorised_with_others_compounds):
         ]
     ]
 
-    return df_insecticide
+    return _downcast(df_insecticide)
 
 
 def create_df_pheromones(df_bio_vigne_main_authorised_with_others_compounds):
@@ -452,8 +707,7 @@ def create_df_pheromones(df_bio_vigne_main_authorised_with_others_compounds):
 
     * The function filters the input DataFrame based on the presence of 'pheromones' in the 'Substances actives' column.
     * The 'Active Compound' column is derived from the 'Substances actives' column, with some specific replacements.
-    * The 'Biocontrôle (1/0)' column is created, with 1 indicating the presence of 'biocontrôle' in the 'mentions autorisees',
-        and 0 otherwise.
+    * The 'Biocontrôle (1/0)' column comes from 'get_flags'.
 
     The resulting DataFrame includes columns: 'nom produit', 'Active Compound', and 'Biocontrôle (1/0)'.
     """
@@ -469,14 +723,10 @@ def create_df_pheromones(df_bio_vigne_main_authorised_with_others_compounds):
         .replace("|", "+")
     )
 
-    df_pheromones["Biocontrôle (1/0)"] = df_pheromones["mentions autorisees"].apply(
-        lambda x: 1 if "biocontrôle" in x.lower() else 0
-    )
-
     df_pheromones = df_pheromones[
         ["nom produit", "Active Compound", "Biocontrôle (1/0)"]
     ]
-    return df_pheromones
+    return _downcast(df_pheromones)
 
 
 def create_df_others(df_bio_vigne_main_authorised_with_others_compounds):
@@ -489,44 +739,17 @@ def create_df_others(df_bio_vigne_main_authorised_with_others_compounds):
     Returns:
         pd.DataFrame: DataFrame containing processed rows excluding specified substances.
 
-    The function filters the input DataFrame based on the absence of specified substances in a case-insensitive manner.
-    The resulting DataFrame includes all rows excluding the specified substances and computes additional columns:
-    * 'Concentration': Extracts concentration information from the 'Substances actives' column.
-    * 'Dose': Computes the dose based on concentration and 'dose retenue'.
-    * 'Insecticide': Flags rows where 'fonctions' column contains the term 'insecticide'.
-    * 'Biocontrôle (1/0)': Flags rows where 'mentions autorisees' column contains the term 'biocontrôle'.
-    """
-    substances_to_exclude = [
-        "Spinosad",
-        "Bacillus",
-        "pyréthrines",
-        "soufre",
-        "Sulphur",
-        "cuivre",
-        "pheromones",
-    ]
+    The function filters the input DataFrame based on the absence of the OTHERS_EXCLUDED_SUBSTANCES in a case-insensitive manner.
+    The resulting DataFrame includes all rows excluding the specified substances and rounds the 'Dose' from
+    'get_concentration_and_dose'. The 'Insecticide' and 'Biocontrôle (1/0)' flags come from 'get_flags'.
+    """
     df_others = df_bio_vigne_main_authorised_with_others_compounds[
-        ~df_bio_vigne_main_authorised_with_others_compounds["Substances actives"].apply(
-            lambda x: any(sub.lower() in x.lower() for sub in substances_to_exclude)
-        )
+        ~df_bio_vigne_main_authorised_with_others_compounds[
+            "Substances actives"
+        ].str.contains(_OTHERS_EXCLUDED_PATTERN, case=False, na=False)
     ].reset_index(drop=True)
 
-    df_others["Concentration"] = df_others["Substances actives"].str.split(")").str[1]
-
-    df_others["Concentration"] = df_others["Concentration"].apply(process_concentration)
-    df_others["Dose"] = (
-        ((df_others["Concentration"] / 100) * df_others["dose retenue"])
-        .astype(float)
-        .round(1)
-    )
-
-    df_others["Insecticide"] = df_others["fonctions"].apply(
-        lambda x: 1 if "insecticide" in x.lower() else 0
-    )
-
-    df_others["Biocontrôle (1/0)"] = df_others["mentions autorisees"].apply(
-        lambda x: 1 if "biocontrôle" in x.lower() else 0
-    )
+    df_others["Dose"] = df_others["Dose"].round(1)
     df_others = df_others[
         [
             "nom produit",
@@ -540,64 +763,74 @@ def create_df_others(df_bio_vigne_main_authorised_with_others_compounds):
         ]
     ]
 
-    return df_others
+    return _downcast(df_others)
+
+
+# Builders of the product tables, in the order of the Excel sheet
+PRODUCT_TABLES = [
+    create_df_cuivre,
+    create_df_soufre,
+    create_df_insecticide,
+    create_df_pheromones,
+    create_df_others,
+]
 
 
 def combine_products(df_bio_vigne_main_authorised_with_others_compounds):
-    def rename_columns(df):
-        """
-        Combine different DataFrames for specific products into a single DataFrame.
-
-        Parameters:
-        - df_bio_vigne_main_authorised_with_others_compounds (pd.DataFrame): The main DataFrame containing information about authorized products.
-
-        Returns:
-        - pd.DataFrame: The combined DataFrame with renamed columns.
-        """
-
-        column_mapping = {
-            "nom produit": "Spécialité commerciale",
-            "Active Compound": "Matière active (M.A.)",
-            "Autres": "Autre",
-            "Concentration": "Concentration en M.A. (% )",
-            "dose retenue": "Dose d'homologation (en kg ou L / ha)",
-            "Dose": "Dose d'homologation (en kg ou L / ha)",
-            "nombre max d'application": "Nombre de traitements autorisés",
-            "Biocontrôle (1/0)": "New Biocontrol Column",  # Example with a column not present in the DataFrame
-        }
+    """
+    Combine different DataFrames for specific products into a single DataFrame.
 
-        existing_columns = set(df.columns)
-        mapping = {
-            old_name: new_name
-            for old_name, new_name in column_mapping.items()
-            if old_name in existing_columns
-        }
+    Parameters:
+    - df_bio_vigne_main_authorised_with_others_compounds (pd.DataFrame): The main DataFrame containing information about authorized products.
 
-        return df.rename(columns=mapping)
+    Returns:
+    - pd.DataFrame: The combined DataFrame with renamed columns.
 
-    df_cuivre = rename_columns(
-        create_df_cuivre(df_bio_vigne_main_authorised_with_others_compounds)
-    )
-    df_soufre = rename_columns(
-        create_df_soufre(df_bio_vigne_main_authorised_with_others_compounds)
-    )
-    df_insecticide = rename_columns(
-        create_df_insecticide(df_bio_vigne_main_authorised_with_others_compounds)
-    )
-    df_pheromones = rename_columns(
-        create_df_pheromones(df_bio_vigne_main_authorised_with_others_compounds)
-    )
-    df_others = df_others = rename_columns(
-        create_df_others(df_bio_vigne_main_authorised_with_others_compounds)
-    )
+    The tables are placed side by side (axis=1), one block of columns per product type,
+    because this is the layout of the Excel sheet. Every table has its own RangeIndex,
+    so the blocks are aligned row by row and the shorter ones are padded with empty cells.
+    """
 
-    df_combined_products = pd.concat(
-        [df_cuivre, df_soufre, df_insecticide, df_pheromones, df_others], axis=1
-    )
+    # The tables are independent and only read the shared DataFrame, so they are built
+    # in parallel threads (the NumPy and Arrow work releases the GIL)
+    with ThreadPoolExecutor(max_workers=len(PRODUCT_TABLES)) as executor:
+        product_tables = executor.map(
+            lambda create_df: create_df(
+                df_bio_vigne_main_authorised_with_others_compounds
+            ).rename(columns=OUTPUT_COLUMN_NAMES),
+            PRODUCT_TABLES,
+        )
+        df_combined_products = pd.concat(list(product_tables), axis=1)
 
     return df_combined_products
 
 
+def write_csv(df, file_name):
+    """
+    Writes the DataFrame to a CSV file with ";" separators, using the pyarrow CSV writer.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to write, column names may be duplicated.
+        file_name (str): The name of the CSV file.
+
+    Operation:
+    * The columns are converted one by one to Arrow arrays, since pa.Table.from_pandas
+      refuses the duplicated column names of the combined products.
+    * Values are quoted only when they are strings, so a ";" in a product name stays safe.
+    * The file is written through a _WRITE_BUFFER_SIZE buffer, in a few large writes.
+    """
+    table = pa.Table.from_arrays(
+        [pa.array(df.iloc[:, i], from_pandas=True) for i in range(df.shape[1])],
+        names=[str(column) for column in df.columns],
+    )
+    with pa.output_stream(file_name, buffer_size=_WRITE_BUFFER_SIZE) as output:
+        pa_csv.write_csv(
+            table,
+            output,
+            write_options=pa_csv.WriteOptions(delimiter=";", quoting_style="needed"),
+        )
+
+
 def get_amm(file_name="amm.csv"):
     """
     Download, clean, and process AMM (Autorisation de Mise sur le Marché) data related to vine products.
@@ -616,10 +849,20 @@ def get_amm(file_name="amm.csv"):
     df_bio_vigne_main_authorised_with_others_compounds = get_active_compound(
         df_bio_vigne_main_authorised_with_others
     )
+    df_bio_vigne_main_authorised_with_others_compounds = get_concentration_and_dose(
+        df_bio_vigne_main_authorised_with_others_compounds
+    )
+    df_bio_vigne_main_authorised_with_others_compounds = get_flags(
+        df_bio_vigne_main_authorised_with_others_compounds
+    )
 
     df_combined_products = combine_products(
         df_bio_vigne_main_authorised_with_others_compounds
     )
-    df_combined_products.to_csv(file_name, sep=";", index=False)
+    write_csv(df_combined_products, file_name)
 
     return 0
+
+
+if __name__ == "__main__":
+    get_amm()